@@ -3,6 +3,9 @@ import logging
 import json
 import os
 import base64
+import functools
+import threading
+import time
 from datetime import datetime
 
 from langchain.callbacks.base import BaseCallbackHandler
@@ -16,12 +19,58 @@ from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 from utils.pdf_processor import DocumentProcessor
 from utils.document_store import DocumentStore
-from utils.chat_utils import create_llm, format_document_context
+from utils.chat_utils import create_llm, format_document_summary, build_system_message, extract_token_usage
+from utils.summary_utils import summarize_document, is_summary_request
 from utils.document_utils import create_chat_document
+from utils.admission_control import AdmissionController, AdmissionRejected, client_id_from_headers, worker_thread_count
+from utils.state_store import create_state_backend
 
 app = func.FunctionApp()
-document_processor = DocumentProcessor()
-document_store = DocumentStore()
+# Document content and metadata are kept in a shared backend (STATE_BACKEND) so
+# any scaled-out instance can serve a chat about a document uploaded elsewhere
+state_backend = create_state_backend()
+document_processor = DocumentProcessor(backend=state_backend)
+document_store = DocumentStore(backend=state_backend)
+
+# Admission control: chats are limited by estimated LLM tokens, uploads by payload bytes.
+# Sync functions run on the worker's thread pool and queued requests block a thread
+# while they wait, so the default limits are sized to leave threads for other routes.
+worker_threads = worker_thread_count()
+chat_admission = AdmissionController(
+    "chat",
+    max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENT", str(max(1, worker_threads // 2)))),
+    max_concurrent_per_client=int(os.getenv("CHAT_MAX_CONCURRENT_PER_CLIENT", "2")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", str(worker_threads // 4))),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "15")),
+    tokens_per_minute=float(os.getenv("CHAT_TOKENS_PER_MINUTE", "200000")),
+    tokens_per_minute_per_client=float(os.getenv("CHAT_TOKENS_PER_MINUTE_PER_CLIENT", "50000"))
+)
+upload_admission = AdmissionController(
+    "upload",
+    max_concurrent=int(os.getenv("UPLOAD_MAX_CONCURRENT", str(max(1, worker_threads // 8)))),
+    max_concurrent_per_client=int(os.getenv("UPLOAD_MAX_CONCURRENT_PER_CLIENT", "1")),
+    max_queue=int(os.getenv("UPLOAD_MAX_QUEUE", str(worker_threads // 16))),
+    queue_timeout=float(os.getenv("UPLOAD_QUEUE_TIMEOUT_SECONDS", "30")),
+    tokens_per_minute=float(os.getenv("UPLOAD_BYTES_PER_MINUTE", str(200 * 1024 * 1024))),
+    tokens_per_minute_per_client=float(os.getenv("UPLOAD_BYTES_PER_MINUTE_PER_CLIENT", str(50 * 1024 * 1024)))
+)
+# Summaries are built in the background from the document-summaries queue and
+# have their own LLM token budget, so they never eat into the chat budget.
+# Only the token buckets are used; the queue trigger is not an HTTP request.
+summary_admission = AdmissionController(
+    "summary",
+    max_concurrent=1,
+    max_concurrent_per_client=1,
+    max_queue=0,
+    queue_timeout=0,
+    tokens_per_minute=float(os.getenv("SUMMARY_TOKENS_PER_MINUTE", "200000")),
+    tokens_per_minute_per_client=float(os.getenv("SUMMARY_TOKENS_PER_MINUTE_PER_CLIENT", "50000"))
+)
+if chat_admission.max_threads + upload_admission.max_threads >= worker_threads:
+    logging.warning(
+        f"Chat and upload limits can block {chat_admission.max_threads + upload_admission.max_threads} "
+        f"of {worker_threads} worker threads; raise PYTHON_THREADPOOL_THREAD_COUNT or lower the limits"
+    )
 
 # CORS headers
 def add_cors_headers(response):
@@ -46,8 +95,133 @@ def handle_cors_preflight(req):
         )
     return None
 
+# Document lifecycle: uploads are evicted after a TTL, after being idle, or
+# least recently used first once the state backend holds more than
+# DOCUMENT_MAX_COUNT documents across all instances. 0 disables a limit.
+DOCUMENT_TTL_SECONDS = float(os.getenv("DOCUMENT_TTL_SECONDS", "86400"))
+DOCUMENT_IDLE_SECONDS = float(os.getenv("DOCUMENT_IDLE_SECONDS", "3600"))
+DOCUMENT_MAX_COUNT = int(os.getenv("DOCUMENT_MAX_COUNT", "100"))
+DOCUMENT_EVICTION_INTERVAL_SECONDS = float(os.getenv("DOCUMENT_EVICTION_INTERVAL_SECONDS", "60"))
+# Content without metadata is only swept once it is older than this, so
+# uploads that have stored their content but not yet their metadata survive
+DOCUMENT_ORPHAN_GRACE_SECONDS = float(os.getenv("DOCUMENT_ORPHAN_GRACE_SECONDS", "300"))
+DOCUMENT_SUMMARIES_ENABLED = os.getenv("DOCUMENT_SUMMARIES_ENABLED", "true").lower() == "true"
+eviction_lock = threading.Lock()
+last_eviction_at = 0.0
+
+def remove_document(doc_id):
+    """Remove a document's content, metadata and anything derived from it together."""
+    removed_content = document_processor.remove_document(doc_id)
+    removed_metadata = document_store.remove_document(doc_id)
+    return removed_content or removed_metadata
+
+def evict_documents(ttl_seconds=None, idle_seconds=None, force=False):
+    """Remove expired documents, at most once per eviction interval unless forced.
+    
+    Returns the IDs of the removed documents.
+    """
+    global last_eviction_at
+    
+    now = time.monotonic()
+    if not force and now - last_eviction_at < DOCUMENT_EVICTION_INTERVAL_SECONDS:
+        return []
+    
+    with eviction_lock:
+        last_eviction_at = now
+        expired_ids = document_store.get_expired_document_ids(
+            ttl_seconds=DOCUMENT_TTL_SECONDS if ttl_seconds is None else ttl_seconds,
+            idle_seconds=DOCUMENT_IDLE_SECONDS if idle_seconds is None else idle_seconds,
+            max_documents=DOCUMENT_MAX_COUNT
+        )
+        for doc_id in expired_ids:
+            remove_document(doc_id)
+        
+        # Halves of a document left behind by a failed upload or by a write that
+        # raced a delete on another instance. Content is stored before metadata,
+        # so metadata without content is always safe to remove.
+        listed_ids = set(document_store.documents.keys())
+        orphaned_ids = document_processor.get_orphaned_document_ids(listed_ids, DOCUMENT_ORPHAN_GRACE_SECONDS)
+        orphaned_ids += sorted(doc_id for doc_id in listed_ids if not document_processor.get_document_info(doc_id))
+        for doc_id in orphaned_ids:
+            remove_document(doc_id)
+    
+    if expired_ids:
+        logging.info(f"Evicted {len(expired_ids)} documents: {expired_ids}")
+    if orphaned_ids:
+        logging.info(f"Removed {len(orphaned_ids)} incomplete documents: {orphaned_ids}")
+    return expired_ids + orphaned_ids
+
+def get_client_id(req):
+    """Identify the caller for per-client limits."""
+    return client_id_from_headers(req.headers)
+
+def too_many_requests(error):
+    """Build a 429 response with a retry hint."""
+    return add_cors_headers(func.HttpResponse(
+        json.dumps({
+            "error": error.reason,
+            "retry_after": error.retry_after
+        }),
+        status_code=429,
+        mimetype="application/json",
+        headers={
+            "Retry-After": str(error.retry_after),
+            "Access-Control-Expose-Headers": "Retry-After"
+        }
+    ))
+
+def admission_controlled(controller, estimate_cost=None):
+    """Run the handler only once `controller` admits the request."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(req: func.HttpRequest, *args, **kwargs) -> func.HttpResponse:
+            # CORS preflight requests are cheap and must never be queued
+            if req.method == "OPTIONS":
+                return handler(req, *args, **kwargs)
+            
+            client_id = get_client_id(req)
+            cost = estimate_cost(req) if estimate_cost else 0
+            try:
+                controller.acquire(client_id, cost)
+            except AdmissionRejected as e:
+                logging.warning(f"Rejected {controller.name} request from {client_id}: {e.reason} {controller.get_stats()}")
+                return too_many_requests(e)
+            
+            try:
+                return handler(req, *args, **kwargs)
+            finally:
+                controller.release(client_id)
+        return wrapper
+    return decorator
+
+def estimate_upload_bytes(req):
+    """Estimate upload cost from the request payload size."""
+    return len(req.get_body() or b"")
+
+def estimate_chat_tokens(req):
+    """Roughly estimate prompt tokens for a chat request (about 4 characters per token)."""
+    num_chars = len(req.get_body() or b"")
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        return num_chars // 4
+    if isinstance(req_body, dict):
+        # Summary requests are answered from the summary when there is one
+        message = req_body.get('message')
+        use_summaries = isinstance(message, str) and is_summary_request(message)
+        for doc_id in req_body.get('doc_ids') or []:
+            if not isinstance(doc_id, str):
+                continue
+            document_info = document_processor.get_document_info(doc_id)
+            if document_info:
+                summary_length = len(format_document_summary(document_info)) if use_summaries else 0
+                num_chars += summary_length or document_info["content_length"]
+    return num_chars // 4
+
 @app.route(route="upload_pdf", methods=["POST", "OPTIONS"])
-def upload_pdf(req: func.HttpRequest) -> func.HttpResponse:
+@app.queue_output(arg_name="summary_queue", queue_name="document-summaries", connection="AzureWebJobsStorage")
+@admission_controlled(upload_admission, estimate_cost=estimate_upload_bytes)
+def upload_pdf(req: func.HttpRequest, summary_queue: func.Out[str]) -> func.HttpResponse:
     # Handle CORS preflight
     cors_response = handle_cors_preflight(req)
     if cors_response:
@@ -72,6 +246,9 @@ def upload_pdf(req: func.HttpRequest) -> func.HttpResponse:
         ))
     
     try:
+        # Make room before holding another document in memory
+        evict_documents()
+        
         # Decode the base64 document
         doc_bytes = base64.b64decode(doc_base64)
         
@@ -87,12 +264,22 @@ def upload_pdf(req: func.HttpRequest) -> func.HttpResponse:
         # Add to document store
         document_store.add_document(result["doc_id"], result["filename"], result["num_chunks"])
         
+        # The summary and outline that let overview questions skip the full text
+        # are built in the background, so the upload returns without waiting
+        if DOCUMENT_SUMMARIES_ENABLED:
+            summary_queue.set(json.dumps({
+                "doc_id": result["doc_id"],
+                "client_id": get_client_id(req)
+            }))
+        
         return add_cors_headers(func.HttpResponse(
             json.dumps({
                 "success": True,
                 "doc_id": result["doc_id"],
                 "filename": result["filename"],
-                "num_chunks": result["num_chunks"]
+                "num_chunks": result["num_chunks"],
+                "has_summary": False,
+                "summary_pending": DOCUMENT_SUMMARIES_ENABLED
             }),
             mimetype="application/json"
         ))
@@ -110,6 +297,27 @@ def upload_pdf(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500
         ))
 
+@app.queue_trigger(arg_name="msg", queue_name="document-summaries", connection="AzureWebJobsStorage")
+def summarize_uploaded_document(msg: func.QueueMessage) -> None:
+    # Failures raise so the message is retried after the queue's visibility
+    # timeout, and moved to the poison queue after maxDequeueCount attempts
+    task = msg.get_json()
+    doc_id = task["doc_id"]
+    
+    document_content = document_processor.get_document_content(doc_id)
+    if not document_content or not isinstance(document_content.get("content"), str):
+        logging.info(f"Document {doc_id} was removed before it could be summarized")
+        return
+    
+    # Summarizing reads the whole document once
+    summary_tokens = len(document_content["content"]) // 4
+    if not summary_admission.try_charge(task.get("client_id") or "anonymous", summary_tokens):
+        raise RuntimeError(f"Summary token budget exhausted, retrying summary of {doc_id} later")
+    
+    summary = summarize_document(create_llm(temperature=0), document_content["content"])
+    document_processor.set_document_summary(doc_id, summary)
+    logging.info(f"Stored summary of document {doc_id}")
+
 @app.route(route="list_documents", methods=["GET", "OPTIONS"])
 def list_documents(req: func.HttpRequest) -> func.HttpResponse:
     # Handle CORS preflight
@@ -118,6 +326,7 @@ def list_documents(req: func.HttpRequest) -> func.HttpResponse:
         return cors_response
     
     try:
+        evict_documents()
         documents = document_store.get_all_documents()
         return add_cors_headers(func.HttpResponse(
             json.dumps(documents),
@@ -130,7 +339,111 @@ def list_documents(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500
         ))
 
+@app.route(route="delete_document", methods=["POST", "OPTIONS"])
+def delete_document(req: func.HttpRequest) -> func.HttpResponse:
+    # Handle CORS preflight
+    cors_response = handle_cors_preflight(req)
+    if cors_response:
+        return cors_response
+
+    try:
+        req_body = req.get_json()
+        if not isinstance(req_body, dict):
+            raise ValueError("Request body is not a JSON object")
+    except ValueError:
+        logging.error("Invalid JSON received")
+        return add_cors_headers(func.HttpResponse(
+            "Please pass a valid JSON object in the request body",
+            status_code=400
+        ))
+    
+    doc_id = req_body.get('doc_id')
+    if not doc_id or not isinstance(doc_id, str):
+        return add_cors_headers(func.HttpResponse(
+            "Please provide 'doc_id' in the request body",
+            status_code=400
+        ))
+    
+    try:
+        with eviction_lock:
+            removed = remove_document(doc_id)
+        if not removed:
+            return add_cors_headers(func.HttpResponse(
+                f"Document {doc_id} not found",
+                status_code=404
+            ))
+        
+        return add_cors_headers(func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "doc_id": doc_id
+            }),
+            mimetype="application/json"
+        ))
+    except Exception as e:
+        logging.error(f"Error deleting document: {e}")
+        return add_cors_headers(func.HttpResponse(
+            f"Error deleting document: {str(e)}",
+            status_code=500
+        ))
+
+@app.route(route="expire_documents", methods=["POST", "OPTIONS"])
+def expire_documents(req: func.HttpRequest) -> func.HttpResponse:
+    # Handle CORS preflight
+    cors_response = handle_cors_preflight(req)
+    if cors_response:
+        return cors_response
+
+    # The body is optional; without it the configured limits are applied
+    try:
+        req_body = req.get_json() if req.get_body() else {}
+        if not isinstance(req_body, dict):
+            raise ValueError("Request body is not a JSON object")
+    except ValueError:
+        logging.error("Invalid JSON received")
+        return add_cors_headers(func.HttpResponse(
+            "Please pass a valid JSON object in the request body",
+            status_code=400
+        ))
+    
+    try:
+        ttl_seconds = req_body.get('ttl_seconds')
+        idle_seconds = req_body.get('idle_seconds')
+        removed_ids = evict_documents(
+            ttl_seconds=float(ttl_seconds) if ttl_seconds is not None else None,
+            idle_seconds=float(idle_seconds) if idle_seconds is not None else None,
+            force=True
+        )
+        
+        return add_cors_headers(func.HttpResponse(
+            json.dumps({
+                "success": True,
+                "removed": removed_ids
+            }),
+            mimetype="application/json"
+        ))
+    except (TypeError, ValueError) as ve:
+        return add_cors_headers(func.HttpResponse(
+            f"Invalid expiry settings: {str(ve)}",
+            status_code=400
+        ))
+    except Exception as e:
+        logging.error(f"Error expiring documents: {e}")
+        return add_cors_headers(func.HttpResponse(
+            f"Error expiring documents: {str(e)}",
+            status_code=500
+        ))
+
+@app.timer_trigger(schedule="0 */5 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def evict_expired_documents(timer: func.TimerRequest) -> None:
+    # Runs every five minutes, so eviction also happens on instances that only
+    # serve chats. Uploads and listings still sweep opportunistically in between.
+    if timer.past_due:
+        logging.info("Document eviction timer is past due")
+    evict_documents(force=True)
+
 @app.route(route="chat", methods=["POST", "OPTIONS"])
+@admission_controlled(chat_admission, estimate_cost=estimate_chat_tokens)
 def chat(req: func.HttpRequest) -> func.HttpResponse:
     # Handle CORS preflight
     cors_response = handle_cors_preflight(req)
@@ -173,12 +486,18 @@ def chat(req: func.HttpRequest) -> func.HttpResponse:
         class ThinkingLogHandler(BaseCallbackHandler):
             def __init__(self):
                 self.logs = []
+                self.token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
                 
             def on_llm_start(self, serialized, prompts, **kwargs):
                 self.logs.append({"type": "llm_start", "prompts": prompts})
                 
             def on_llm_end(self, response, **kwargs):
                 self.logs.append({"type": "llm_end", "response": response.dict()})
+                # Record prompt cache hits so prefix stability can be monitored
+                usage = extract_token_usage(response)
+                for key, value in usage.items():
+                    self.token_usage[key] += value
+                self.logs.append({"type": "token_usage", **usage})
                 
             def on_llm_error(self, error, **kwargs):
                 self.logs.append({"type": "llm_error", "error": str(error)})
@@ -211,44 +530,43 @@ def chat(req: func.HttpRequest) -> func.HttpResponse:
         # Initialize the LLM
         llm = create_llm(callback_manager=callback_manager)
         
-        # Create the system message with current date
-        base_system_message = f"""IMPORTANT: The current date is {current_date}. You MUST use this date when referring to today's date. DO NOT use any other date as today's date. You are a helpful AI assistant."""
+        # Summary and overview questions are answered from the precomputed
+        # summaries instead of the full document text
+        use_summaries = is_summary_request(user_message)
+        logging.info(f"Using precomputed summaries: {use_summaries}")
         
-        # Add web search capability to system message only if enabled
-        if use_web_search:
-            base_system_message += " You have the ability to search the web for current information. When asked about current events, news, or anything time-sensitive, you should use the BingSearch tool to find up-to-date information."
-        
-        # Check if we have document contexts
+        # Check if we have document contexts. Documents are visited in a fixed
+        # order so the same selection always produces the same prompt prefix.
         document_contexts = []
+        missing_doc_ids = []
         if doc_ids:
-            for doc_id in doc_ids:
+            for doc_id in sorted(set(doc_ids)):
                 logging.info(f"Attempting to retrieve document with ID: {doc_id}")
-                document_content = document_processor.get_document_content(doc_id)
-                if document_content:
-                    formatted_context = format_document_context(document_content)
+                document_info = document_processor.get_document_info(doc_id)
+                if not document_info:
+                    # Reported back so the client can drop it instead of silently
+                    # getting answers without the document
+                    logging.warning(f"Document {doc_id} not found, it may have been deleted or expired")
+                    missing_doc_ids.append(doc_id)
+                else:
+                    document_store.touch_document(doc_id)
+                    formatted_context = format_document_summary(document_info) if use_summaries else ""
+                    if not formatted_context:
+                        formatted_context = document_processor.get_formatted_context(doc_id)
                     if formatted_context:
+                        doc_info = document_store.get_document(doc_id)
                         document_contexts.append({
                             'doc_id': doc_id,
+                            'filename': doc_info['filename'] if doc_info else 'Unknown Document',
                             'content': formatted_context
                         })
         
-        if document_contexts:
-            # Add all document contexts to the system message
-            base_system_message += "\nUse the following document contents to answer questions:\n"
-            for ctx in document_contexts:
-                doc_info = document_store.get_document(ctx['doc_id'])
-                filename = doc_info['filename'] if doc_info else 'Unknown Document'
-                base_system_message += f"\n[Document: {filename}]\n{ctx['content']}\n"
-                
-            base_system_message += "\nWhen using information from these documents, please specify which document you are referencing."
-        
-        # Add search instructions to system message only if web search is enabled
-        if use_web_search:
-            base_system_message += """
-            When asked about current events, news, or anything time-sensitive, you should use the BingSearch tool to find up-to-date information.
-            The search tool will automatically include today's date to ensure results are current.
-            If you don't know the answer to a question, you can use the BingSearch tool to look it up.
-            """
+        # Stable document content forms the prefix; web search text and the date go last
+        base_system_message = build_system_message(
+            [(ctx['filename'], ctx['content']) for ctx in document_contexts],
+            current_date,
+            use_web_search=use_web_search
+        )
         
         logging.info(f"System message being used: {base_system_message}")
         
@@ -281,6 +599,24 @@ def chat(req: func.HttpRequest) -> func.HttpResponse:
         # Create a list of tools for the agent
         tools = []
         
+        # Create document tools for each document context. These are added before
+        # the optional search tool so the tool definitions keep a stable prefix.
+        for ctx in document_contexts:
+            filename = ctx['filename']
+            
+            try:
+                # Create a tool that returns this document's content, which is only
+                # decompressed if the agent actually calls it
+                doc_tool = lc_tools.Tool(
+                    name=f"Document_{ctx['doc_id']}",
+                    description=f"Useful for getting information from the document '{filename}'. Use this when you need to answer questions about this specific document's content. Input 'page N' or 'pages N-M' to read only those pages.",
+                    func=lambda x, doc_id=ctx['doc_id']: document_processor.get_formatted_context(doc_id, query=x)
+                )
+                tools.append(doc_tool)
+                logging.info(f"Added document tool for {filename}")
+            except Exception as e:
+                logging.error(f"Error creating document tool for {filename}: {e}")
+        
         # Set up Bing Search as a tool only if web search is enabled
         if use_web_search:
             try:
@@ -350,23 +686,6 @@ def chat(req: func.HttpRequest) -> func.HttpResponse:
         else:
             logging.info("Web search is disabled - not adding BingSearch tool")
         
-        # Create document tools for each document context
-        for ctx in document_contexts:
-            doc_info = document_store.get_document(ctx['doc_id'])
-            filename = doc_info['filename'] if doc_info else 'Unknown Document'
-            
-            try:
-                # Create a tool that returns this document's content
-                doc_tool = lc_tools.Tool(
-                    name=f"Document_{ctx['doc_id']}",
-                    description=f"Useful for getting information from the document '{filename}'. Use this when you need to answer questions about this specific document's content.",
-                    func=lambda x, content=ctx['content']: content
-                )
-                tools.append(doc_tool)
-                logging.info(f"Added document tool for {filename}")
-            except Exception as e:
-                logging.error(f"Error creating document tool for {filename}: {e}")
-        
         # Use agent if we have any tools available
         if use_agent and tools:
             logging.info(f"Using agent with {len(tools)} tools")
@@ -421,9 +740,19 @@ def chat(req: func.HttpRequest) -> func.HttpResponse:
                 # Fall back to regular LLM if agent fails
                 response_text = "I encountered an error while processing your request. Falling back to standard response.\n\n"
                 
+                # Without the document tools the model only sees the prompt, so
+                # summaries are replaced by the full document text
+                fallback_system_message = base_system_message
+                if use_summaries and document_contexts:
+                    fallback_system_message = build_system_message(
+                        [(ctx['filename'], document_processor.get_formatted_context(ctx['doc_id'])) for ctx in document_contexts],
+                        current_date,
+                        use_web_search=use_web_search
+                    )
+                
                 # Fall back to regular chat completion
                 messages = [
-                    {"role": "system", "content": base_system_message},
+                    {"role": "system", "content": fallback_system_message},
                     {"role": "user", "content": user_message}
                 ]
                 response = llm.invoke(messages)
@@ -489,10 +818,17 @@ def chat(req: func.HttpRequest) -> func.HttpResponse:
         # Serialize logs safely for frontend
         safe_logs = safe_serialize_logs(thinking_logs.logs)
         logging.debug(f"Returning thinking_logs: {json.dumps(safe_logs)[:1000]}")
+        logging.info(
+            f"Token usage: prompt={thinking_logs.token_usage['prompt_tokens']}, "
+            f"cached={thinking_logs.token_usage['cached_tokens']}, "
+            f"completion={thinking_logs.token_usage['completion_tokens']}"
+        )
         return add_cors_headers(func.HttpResponse(
             json.dumps({
                 "message": response_text,
-                "thinking_logs": safe_logs
+                "thinking_logs": safe_logs,
+                "token_usage": thinking_logs.token_usage,
+                "missing_doc_ids": missing_doc_ids
             }),
             mimetype="application/json"
         ))
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from utils import admission_control
+from utils.admission_control import AdmissionController, AdmissionRejected, client_id_from_headers, worker_thread_count
+
+def make_controller(**overrides):
+    settings = {
+        "name": "test",
+        "max_concurrent": 2,
+        "max_concurrent_per_client": 2,
+        "max_queue": 1,
+        "queue_timeout": 0.2,
+    }
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+def test_rejects_when_queue_wait_times_out():
+    controller = make_controller(max_concurrent=1)
+    controller.acquire("a")
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("b")
+
+    assert time.monotonic() - started >= 0.2
+    assert "timed out" in excinfo.value.reason
+    assert controller.get_stats()["waiting"] == 0
+
+def test_rejects_immediately_when_queue_is_full():
+    controller = make_controller(max_concurrent=1, queue_timeout=1.0)
+    controller.acquire("a")
+    outcomes = []
+
+    def wait_for_slot():
+        try:
+            controller.acquire("b")
+            outcomes.append(None)
+        except AdmissionRejected as e:
+            outcomes.append(e)
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    while controller.get_stats()["waiting"] == 0:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("c")
+
+    assert time.monotonic() - started < 0.5
+    assert "queue is full" in excinfo.value.reason
+    waiter.join()
+    assert len(outcomes) == 1 and isinstance(outcomes[0], AdmissionRejected)
+    assert "timed out" in outcomes[0].reason
+
+def test_waiting_request_is_admitted_after_release():
+    controller = make_controller(max_concurrent=1, queue_timeout=2.0)
+    controller.acquire("a")
+    threading.Timer(0.05, controller.release, args=("a",)).start()
+
+    controller.acquire("b")
+
+    assert controller.get_stats() == {"active": 1, "waiting": 0, "clients": 1}
+
+def test_client_over_its_share_cannot_fill_the_queue():
+    controller = make_controller(max_concurrent=1, max_concurrent_per_client=1, max_queue=4)
+    controller.acquire("greedy")
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("greedy")
+
+    assert "this client" in excinfo.value.reason
+    assert controller.get_stats()["waiting"] == 0
+
+def test_rate_limit_rejection_carries_retry_after():
+    controller = make_controller(tokens_per_minute_per_client=60)
+    controller.acquire("a", cost=60)
+    controller.release("a")
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("a", cost=30)
+
+    assert "rate limit" in excinfo.value.reason
+    assert 29 <= excinfo.value.retry_after <= 30
+    # Other clients have their own bucket
+    controller.acquire("b", cost=30)
+
+def test_rate_is_checked_again_after_waiting():
+    controller = make_controller(max_concurrent=1, queue_timeout=2.0, tokens_per_minute=60)
+    controller.acquire("a", cost=20)
+
+    def use_up_tokens_and_release():
+        time.sleep(0.05)
+        controller._bucket.consume(40)
+        controller.release("a")
+
+    threading.Thread(target=use_up_tokens_and_release).start()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("b", cost=20)
+
+    assert "rate limit" in excinfo.value.reason
+    assert controller.get_stats()["active"] == 0
+
+def test_try_charge_only_charges_when_budget_allows():
+    controller = make_controller(tokens_per_minute=100)
+
+    assert controller.try_charge("a", 80)
+    assert not controller.try_charge("a", 80)
+    assert controller.try_charge("b", 20)
+    assert controller.get_stats()["active"] == 0
+
+def test_client_buckets_forget_least_recently_seen_client(monkeypatch):
+    monkeypatch.setattr(admission_control, "MAX_TRACKED_CLIENTS", 2)
+    controller = make_controller(tokens_per_minute_per_client=60)
+
+    controller.try_charge("a", 60)
+    controller.try_charge("b", 1)
+    controller.try_charge("a", 0.001)
+    controller.try_charge("c", 1)
+
+    assert list(controller._client_buckets) == ["a", "c"]
+    # "a" was seen recently, so its spent budget is still enforced
+    assert not controller.try_charge("a", 30)
+
+def test_worker_thread_count(monkeypatch):
+    monkeypatch.setenv("PYTHON_THREADPOOL_THREAD_COUNT", "6")
+    assert worker_thread_count() == 6
+
+    monkeypatch.delenv("PYTHON_THREADPOOL_THREAD_COUNT")
+    monkeypatch.setattr(admission_control.os, "cpu_count", lambda: 64)
+    assert worker_thread_count() == 32
+
+def test_client_id_uses_address_appended_by_platform(monkeypatch):
+    monkeypatch.delenv("WEBSITE_AUTH_ENABLED", raising=False)
+
+    assert client_id_from_headers({"x-forwarded-for": "10.0.0.1, 203.0.113.7:5678"}) == "203.0.113.7"
+    assert client_id_from_headers({"x-forwarded-for": "[2001:db8::1]:443"}) == "2001:db8::1"
+    assert client_id_from_headers({"x-azure-clientip": "2001:db8::2", "x-forwarded-for": "10.0.0.1"}) == "2001:db8::2"
+    assert client_id_from_headers({"x-ms-client-principal-id": "spoofed"}) == "anonymous"
+
+def test_client_id_trusts_principal_when_auth_enabled(monkeypatch):
+    monkeypatch.setenv("WEBSITE_AUTH_ENABLED", "True")
+
+    assert client_id_from_headers({"x-ms-client-principal-id": "user-1", "x-forwarded-for": "203.0.113.7"}) == "user-1"
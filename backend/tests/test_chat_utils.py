@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from utils.chat_utils import build_system_message, extract_token_usage
+
+DATE_LINE = "IMPORTANT: The current date is"
+SECTIONS = [("a.pdf", "Document content:\n\nalpha"), ("b.pdf", "Document content:\n\nbeta")]
+
+def test_documents_come_before_web_search_text_and_date():
+    message = build_system_message(SECTIONS, "19 October 2026", use_web_search=True)
+
+    documents_at = message.index("[Document: a.pdf]")
+    assert documents_at < message.index("[Document: b.pdf]")
+    assert message.index("beta") < message.index("BingSearch") < message.index(DATE_LINE)
+    assert message.rstrip().endswith("DO NOT use any other date as today's date.")
+
+def test_prefix_is_identical_across_dates():
+    today = build_system_message(SECTIONS, "19 October 2026")
+    tomorrow = build_system_message(SECTIONS, "20 October 2026")
+
+    assert today != tomorrow
+    assert today[:today.index(DATE_LINE)] == tomorrow[:tomorrow.index(DATE_LINE)]
+
+def test_web_search_text_does_not_change_document_prefix():
+    without_search = build_system_message(SECTIONS, "19 October 2026")
+    with_search = build_system_message(SECTIONS, "19 October 2026", use_web_search=True)
+
+    prefix = without_search[:without_search.index(DATE_LINE)].rstrip("\n")
+    assert with_search.startswith(prefix)
+
+def test_token_usage_from_llm_output():
+    response = SimpleNamespace(
+        llm_output={"token_usage": {
+            "prompt_tokens": 1200,
+            "completion_tokens": 50,
+            "prompt_tokens_details": {"cached_tokens": 1024}
+        }},
+        generations=[]
+    )
+
+    assert extract_token_usage(response) == {"prompt_tokens": 1200, "completion_tokens": 50, "cached_tokens": 1024}
+
+def test_token_usage_from_message_usage_metadata():
+    def generation(input_tokens, output_tokens, cache_read):
+        message = SimpleNamespace(usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "input_token_details": {"cache_read": cache_read}
+        })
+        return SimpleNamespace(message=message)
+
+    response = SimpleNamespace(llm_output=None, generations=[[generation(900, 40, 512)], [generation(300, 10, 0)]])
+
+    assert extract_token_usage(response) == {"prompt_tokens": 1200, "completion_tokens": 50, "cached_tokens": 512}
+
+def test_token_usage_without_cache_details():
+    response = SimpleNamespace(llm_output={"token_usage": {"prompt_tokens": 10, "completion_tokens": 2}}, generations=[])
+
+    assert extract_token_usage(response)["cached_tokens"] == 0
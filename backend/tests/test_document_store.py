@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from utils.document_store import DocumentStore
+from utils.state_store import SQLiteBackend
+
+def add_document(store, doc_id, uploaded_ago, accessed_ago):
+    now = datetime.now()
+    store.add_document(doc_id, f"{doc_id}.pdf", 1)
+    doc = store.get_document(doc_id)
+    doc["uploaded_at"] = (now - timedelta(seconds=uploaded_ago)).isoformat()
+    doc["last_accessed_at"] = (now - timedelta(seconds=accessed_ago)).isoformat()
+    store.documents.set(doc_id, doc)
+
+def test_documents_past_ttl_expire_even_when_recently_used():
+    store = DocumentStore()
+    add_document(store, "old", uploaded_ago=7200, accessed_ago=1)
+    add_document(store, "new", uploaded_ago=60, accessed_ago=60)
+
+    assert store.get_expired_document_ids(ttl_seconds=3600) == ["old"]
+
+def test_idle_documents_expire():
+    store = DocumentStore()
+    add_document(store, "idle", uploaded_ago=600, accessed_ago=600)
+    add_document(store, "active", uploaded_ago=600, accessed_ago=10)
+
+    assert store.get_expired_document_ids(idle_seconds=300) == ["idle"]
+
+def test_least_recently_used_documents_are_evicted_over_the_limit():
+    store = DocumentStore()
+    add_document(store, "a", uploaded_ago=300, accessed_ago=5)
+    add_document(store, "b", uploaded_ago=200, accessed_ago=100)
+    add_document(store, "c", uploaded_ago=100, accessed_ago=50)
+
+    assert store.get_expired_document_ids(max_documents=1) == ["b", "c"]
+
+def test_expired_documents_do_not_count_towards_the_limit():
+    store = DocumentStore()
+    add_document(store, "expired", uploaded_ago=7200, accessed_ago=7200)
+    add_document(store, "a", uploaded_ago=100, accessed_ago=100)
+    add_document(store, "b", uploaded_ago=50, accessed_ago=50)
+
+    assert store.get_expired_document_ids(ttl_seconds=3600, max_documents=1) == ["expired", "a"]
+
+def test_zero_disables_a_limit():
+    store = DocumentStore()
+    add_document(store, "a", uploaded_ago=7200, accessed_ago=7200)
+
+    assert store.get_expired_document_ids(ttl_seconds=0, idle_seconds=0, max_documents=0) == []
+
+def test_touch_document_delays_idle_expiry():
+    store = DocumentStore()
+    add_document(store, "a", uploaded_ago=600, accessed_ago=600)
+
+    store.touch_document("a")
+
+    assert store.get_expired_document_ids(idle_seconds=300) == []
+
+def test_touch_does_not_restore_document_deleted_by_another_instance(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    store, other_instance = DocumentStore(backend), DocumentStore(backend)
+    store.add_document("a", "a.pdf", 1)
+    assert store.get_document("a")
+
+    other_instance.remove_document("a")
+    store.touch_document("a")
+
+    assert other_instance.get_document("a") is None
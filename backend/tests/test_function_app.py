@@ -0,0 +1,134 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+func = pytest.importorskip("azure.functions")
+pytest.importorskip("azure.ai.documentintelligence")
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_openai")
+pytest.importorskip("docx")
+
+from utils.pdf_processor import DocumentProcessor
+
+@pytest.fixture(scope="module")
+def function_app():
+    # Importing the app creates a Document Intelligence client; keep it offline
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(DocumentProcessor, "get_document_client", lambda self: None)
+        import function_app
+    return function_app
+
+@pytest.fixture(autouse=True)
+def empty_store(function_app):
+    yield
+    doc_ids = function_app.document_store.documents.keys() + function_app.document_processor.documents.keys()
+    for doc_id in set(doc_ids):
+        function_app.remove_document(doc_id)
+
+def user_function(handler):
+    """Get the plain function behind a decorated Functions trigger."""
+    return handler.build().get_user_function() if hasattr(handler, "build") else handler
+
+def call(handler, body=None):
+    """Invoke a decorated HTTP function the way the host would."""
+    req = func.HttpRequest(
+        method="POST",
+        url="/api/test",
+        headers={"x-forwarded-for": "203.0.113.7"},
+        body=json.dumps(body).encode() if body is not None else b""
+    )
+    return user_function(handler)(req)
+
+def add_content(function_app, doc_id, content_length, summary=None):
+    record = {
+        "filename": f"{doc_id}.pdf",
+        "pages": 1,
+        "num_page_texts": 1,
+        "content_length": content_length,
+        "stored_at": datetime.now().isoformat()
+    }
+    if summary:
+        record["summary"] = {"summary": summary, "sections": [], "outline": []}
+    function_app.document_processor.documents.set(doc_id, record)
+
+def add_document(function_app, doc_id, uploaded_ago=0):
+    add_content(function_app, doc_id, 100)
+    function_app.document_store.add_document(doc_id, f"{doc_id}.pdf", 1)
+    doc = function_app.document_store.get_document(doc_id)
+    doc["uploaded_at"] = (datetime.now() - timedelta(seconds=uploaded_ago)).isoformat()
+    function_app.document_store.documents.set(doc_id, doc)
+
+def test_delete_document(function_app):
+    add_document(function_app, "doc-1")
+
+    response = call(function_app.delete_document, {"doc_id": "doc-1"})
+    assert response.status_code == 200
+    assert json.loads(response.get_body()) == {"success": True, "doc_id": "doc-1"}
+    assert function_app.document_store.get_document("doc-1") is None
+
+    assert call(function_app.delete_document, {"doc_id": "doc-1"}).status_code == 404
+
+def test_delete_document_rejects_invalid_bodies(function_app):
+    assert call(function_app.delete_document, ["doc-1"]).status_code == 400
+    assert call(function_app.delete_document, {"doc_id": 1}).status_code == 400
+    assert call(function_app.delete_document, {}).status_code == 400
+
+def test_expire_documents_uses_requested_ttl(function_app):
+    add_document(function_app, "old", uploaded_ago=600)
+    add_document(function_app, "new")
+
+    response = call(function_app.expire_documents, {"ttl_seconds": 300})
+
+    assert response.status_code == 200
+    assert json.loads(response.get_body())["removed"] == ["old"]
+    assert [doc["doc_id"] for doc in function_app.document_store.get_all_documents()] == ["new"]
+
+def test_eviction_removes_incomplete_documents(function_app):
+    add_document(function_app, "complete")
+    add_content(function_app, "uploading", 100)
+    add_content(function_app, "abandoned", 100)
+    record = function_app.document_processor.documents.get("abandoned")
+    record["stored_at"] = (datetime.now() - timedelta(seconds=function_app.DOCUMENT_ORPHAN_GRACE_SECONDS + 1)).isoformat()
+    function_app.document_processor.documents.set("abandoned", record)
+    function_app.document_store.add_document("no-content", "no-content.pdf", 1)
+
+    removed = function_app.evict_documents(force=True)
+
+    assert removed == ["abandoned", "no-content"]
+    assert sorted(function_app.document_processor.documents.keys()) == ["complete", "uploading"]
+    assert function_app.document_store.documents.keys() == ["complete"]
+
+def test_expire_documents_rejects_invalid_settings(function_app):
+    assert call(function_app.expire_documents, {"ttl_seconds": "soon"}).status_code == 400
+    assert call(function_app.expire_documents, "ttl").status_code == 400
+
+def chat_request(message, doc_ids):
+    return func.HttpRequest(
+        method="POST",
+        url="/api/chat",
+        headers={},
+        body=json.dumps({"message": message, "doc_ids": doc_ids}).encode()
+    )
+
+def test_chat_estimate_uses_summary_for_summary_requests(function_app):
+    add_content(function_app, "summarized", 40000, summary="Short summary")
+    add_content(function_app, "unsummarized", 40000)
+
+    assert function_app.estimate_chat_tokens(chat_request("Summarize this document", ["summarized"])) < 100
+    assert function_app.estimate_chat_tokens(chat_request("Summarize this document", ["unsummarized"])) >= 10000
+    assert function_app.estimate_chat_tokens(chat_request("What was the revenue?", ["summarized"])) >= 10000
+
+def test_summary_worker_skips_removed_documents(function_app, monkeypatch):
+    monkeypatch.setattr(function_app, "summarize_document", lambda llm, content: pytest.fail("summarized"))
+    summarize = user_function(function_app.summarize_uploaded_document)
+
+    summarize(func.QueueMessage(body=json.dumps({"doc_id": "gone", "client_id": "a"})))
+
+def test_summary_worker_retries_when_budget_is_exhausted(function_app, monkeypatch):
+    monkeypatch.setattr(function_app.document_processor, "get_document_content", lambda doc_id: {"content": "text"})
+    monkeypatch.setattr(function_app.summary_admission, "try_charge", lambda client_id, cost: False)
+    summarize = user_function(function_app.summarize_uploaded_document)
+
+    with pytest.raises(RuntimeError):
+        summarize(func.QueueMessage(body=json.dumps({"doc_id": "doc-1", "client_id": "a"})))
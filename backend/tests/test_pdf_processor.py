@@ -0,0 +1,96 @@
+import pytest
+
+pytest.importorskip("azure.ai.documentintelligence")
+pytest.importorskip("langchain_openai")
+
+from utils import pdf_processor
+from utils.pdf_processor import DocumentProcessor
+from utils.state_store import SQLiteBackend
+from utils.summary_utils import PAGE_BREAK
+
+PAGES = ["# Intro\nFirst page text", "Second page text", "## End\nThird page text"]
+CONTENT = PAGE_BREAK.join(PAGES)
+
+class FakeResult:
+    content = CONTENT
+    pages = [object()] * len(PAGES)
+
+class FakePoller:
+    def result(self):
+        return FakeResult()
+
+class FakeClient:
+    def begin_analyze_document(self, *args, **kwargs):
+        return FakePoller()
+
+@pytest.fixture(params=["memory", "sqlite"])
+def processor(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(DocumentProcessor, "get_document_client", lambda self: FakeClient())
+    backend = SQLiteBackend(str(tmp_path / "state.db")) if request.param == "sqlite" else None
+    return DocumentProcessor(backend=backend)
+
+@pytest.fixture
+def doc_id(processor):
+    return processor.process_document(b"%PDF", "report.pdf")["doc_id"]
+
+def test_pages_are_stored_compressed_and_round_trip(processor, doc_id):
+    assert processor.get_document_content(doc_id)["content"] == CONTENT
+    assert processor.get_document_info(doc_id)["content_length"] == len(CONTENT)
+    assert len(processor.pages.keys()) == len(PAGES)
+    assert processor.get_document_pages(doc_id, [2]) == [(2, PAGES[1])]
+
+def test_page_ranges_are_clamped_and_labelled_with_real_pages(processor, doc_id):
+    context = processor.get_formatted_context(doc_id, query="pages 0-2")
+
+    assert "Page 1:\n# Intro" in context
+    assert "Page 2:\nSecond page text" in context
+    assert "Page 0" not in context and "Third page text" not in context
+
+def test_page_range_outside_document_returns_whole_document(processor, doc_id, monkeypatch):
+    looked_up = []
+    original_get = processor.pages.get
+    monkeypatch.setattr(processor.pages, "get", lambda key, **kwargs: looked_up.append(key) or original_get(key, **kwargs))
+
+    context = processor.get_formatted_context(doc_id, query="pages 1-20000000")
+    assert len(looked_up) == len(PAGES)
+    assert "Third page text" in context
+
+    assert processor.get_formatted_context(doc_id, query="pages 7-9") == processor.get_formatted_context(doc_id)
+    assert processor.get_formatted_context(doc_id, query="homepage 2019 stats") == processor.get_formatted_context(doc_id)
+
+def test_formatted_context_cache_is_bounded_by_characters(processor, monkeypatch):
+    first = processor.process_document(b"%PDF", "a.pdf")["doc_id"]
+    second = processor.process_document(b"%PDF", "b.pdf")["doc_id"]
+    context_chars = len(processor.get_formatted_context(first))
+    monkeypatch.setattr(pdf_processor, "FORMATTED_CONTEXT_CACHE_CHARS", context_chars)
+
+    processor.get_formatted_context(second)
+
+    assert list(processor._formatted_contexts) == [second]
+    assert processor._formatted_chars == context_chars
+
+def test_remove_document_clears_pages_and_cached_context(processor, doc_id):
+    processor.get_formatted_context(doc_id)
+
+    assert processor.remove_document(doc_id)
+
+    assert processor.pages.keys() == []
+    assert processor._formatted_contexts == {}
+    assert processor.get_formatted_context(doc_id) == ""
+    assert not processor.remove_document(doc_id)
+
+def test_summary_is_not_written_back_after_delete_elsewhere(tmp_path, monkeypatch):
+    monkeypatch.setattr(DocumentProcessor, "get_document_client", lambda self: FakeClient())
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    processor, other_instance = DocumentProcessor(backend=backend), DocumentProcessor(backend=backend)
+    doc_id = processor.process_document(b"%PDF", "report.pdf")["doc_id"]
+
+    other_instance.remove_document(doc_id)
+    processor.set_document_summary(doc_id, {"summary": "s", "sections": [], "outline": []})
+
+    assert other_instance.documents.keys() == []
+
+def test_orphaned_documents_are_reported_after_grace_period(processor, doc_id):
+    assert processor.get_orphaned_document_ids([doc_id], grace_seconds=0) == []
+    assert processor.get_orphaned_document_ids([], grace_seconds=300) == []
+    assert processor.get_orphaned_document_ids([], grace_seconds=0) == [doc_id]
@@ -0,0 +1,70 @@
+import pytest
+
+from utils.state_store import CachedStore, InMemoryBackend, SQLiteBackend
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+def make_instances(sqlite_path, local_ttl=60.0):
+    """Two stores over separate connections to one database, like two app instances."""
+    first = CachedStore(SQLiteBackend(sqlite_path), "content", local_ttl=local_ttl)
+    second = CachedStore(SQLiteBackend(sqlite_path), "content", local_ttl=local_ttl)
+    return first, second
+
+def test_value_written_by_one_instance_is_read_by_another(sqlite_path):
+    first, second = make_instances(sqlite_path)
+
+    first.set("doc", {"filename": "a.pdf"})
+
+    assert second.get("doc") == {"filename": "a.pdf"}
+    assert second.keys() == ["doc"]
+
+def test_update_is_seen_after_local_ttl(sqlite_path):
+    first, second = make_instances(sqlite_path, local_ttl=0)
+    first.set("doc", {"version": 1})
+    assert second.get("doc") == {"version": 1}
+
+    first.set("doc", {"version": 2})
+
+    assert second.get("doc") == {"version": 2}
+
+def test_local_copy_is_served_within_ttl(sqlite_path):
+    first, second = make_instances(sqlite_path)
+    first.set("doc", {"version": 1})
+    assert second.get("doc") == {"version": 1}
+
+    first.set("doc", {"version": 2})
+
+    assert second.get("doc") == {"version": 1}
+    assert second.get("doc", revalidate=True) == {"version": 2}
+
+def test_delete_invalidates_other_instances(sqlite_path):
+    first, second = make_instances(sqlite_path)
+    first.set("doc", {"filename": "a.pdf"})
+    assert second.get("doc") is not None
+
+    assert first.delete("doc")
+
+    assert second.get("doc", revalidate=True) is None
+    assert second.get("doc") is None
+    assert second.keys() == []
+    assert not first.delete("doc")
+
+def test_raw_values_are_stored_as_bytes(sqlite_path):
+    first = CachedStore(SQLiteBackend(sqlite_path), "page", raw=True)
+    second = CachedStore(SQLiteBackend(sqlite_path), "page", raw=True)
+
+    first.set("doc:1", b"\x78\x9c")
+
+    assert second.get("doc:1") == b"\x78\x9c"
+
+def test_in_memory_backend_keeps_values_as_is():
+    store = CachedStore(InMemoryBackend(), "metadata")
+    value = {"filename": "a.pdf"}
+
+    store.set("doc", value)
+
+    assert store.get("doc") is value
+    assert store.delete("doc")
+    assert store.get("doc") is None
@@ -0,0 +1,95 @@
+from utils.summary_utils import (
+    PAGE_BREAK, MAX_REDUCE_CHARS, MAX_REDUCE_ROUNDS,
+    split_into_chunks, extract_outline, summarize_document, is_summary_request
+)
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+class FakeLLM:
+    """Answers every prompt with a short tag so map and reduce calls can be traced."""
+
+    def __init__(self):
+        self.batches = []
+
+    def batch(self, prompts, config=None):
+        self.batches.append(prompts)
+        return [FakeResponse(f"summary of {len(prompt[1]['content'])} chars") for prompt in prompts]
+
+class VerboseLLM(FakeLLM):
+    """Answers every prompt with more text than a reduce call can take."""
+
+    def batch(self, prompts, config=None):
+        self.batches.append(prompts)
+        return [FakeResponse("x" * MAX_REDUCE_CHARS * 2) for prompt in prompts]
+
+def make_document(*pages):
+    return PAGE_BREAK.join(pages)
+
+def test_split_groups_whole_pages_into_chunks():
+    content = make_document("a" * 40, "b" * 40, "c" * 40)
+
+    chunks = split_into_chunks(content, max_chars=100)
+
+    assert [chunk["pages"] for chunk in chunks] == [(1, 2), (3, 3)]
+    assert chunks[0]["text"] == "a" * 40 + "\n\n" + "b" * 40
+
+def test_split_breaks_up_long_pages_and_skips_empty_ones():
+    content = make_document("a" * 10, "b" * 250, "", "c" * 10, "  ")
+
+    chunks = split_into_chunks(content, max_chars=100)
+
+    assert [chunk["pages"] for chunk in chunks] == [(1, 1), (2, 2), (2, 2), (2, 2), (4, 4)]
+    assert "".join(chunk["text"] for chunk in chunks[1:4]) == "b" * 250
+
+def test_extract_outline_records_heading_pages():
+    content = make_document("# Title\nintro", "text\n## Methods\n### Setup ###", "## Results")
+
+    assert extract_outline(content) == [
+        {"level": 1, "title": "Title", "page": 1},
+        {"level": 2, "title": "Methods", "page": 2},
+        {"level": 3, "title": "Setup", "page": 2},
+        {"level": 2, "title": "Results", "page": 3},
+    ]
+
+def test_summarize_document_maps_chunks_then_reduces():
+    llm = FakeLLM()
+    content = make_document("# Intro\n" + "a" * 7000, "b" * 7000)
+
+    summary = summarize_document(llm, content)
+
+    assert [section["pages"] for section in summary["sections"]] == [[1, 1], [2, 2]]
+    # One map call per chunk, then a single reduce call over both chunk summaries
+    assert [len(batch) for batch in llm.batches] == [2, 1]
+    reduce_input = llm.batches[1][0][1]["content"]
+    assert summary["summary"] == f"summary of {len(reduce_input)} chars"
+    assert summary["outline"] == [{"level": 1, "title": "Intro", "page": 1}]
+
+def test_reduce_terminates_when_summaries_are_longer_than_their_input():
+    llm = VerboseLLM()
+    content = make_document(*["p" * 10000 for _ in range(20)])
+
+    summary = summarize_document(llm, content)
+
+    assert summary["summary"]
+    # One map batch, then reduce rounds that each shrink the list of summaries
+    reduce_batches = llm.batches[1:]
+    assert 1 <= len(reduce_batches) <= MAX_REDUCE_ROUNDS
+    assert [len(batch) for batch in reduce_batches] == sorted((len(batch) for batch in reduce_batches), reverse=True)
+    assert len(reduce_batches[-1]) == 1
+    for batch in reduce_batches:
+        for prompt in batch:
+            assert len(prompt[1]["content"]) <= MAX_REDUCE_CHARS + 100
+
+def test_summary_requests_about_whole_documents():
+    assert is_summary_request("Summarize this document")
+    assert is_summary_request("Can you give me an overview of these files?")
+    assert is_summary_request("What is this document about?")
+
+def test_specific_questions_are_not_summary_requests():
+    assert not is_summary_request("What does the summary table on page 5 say about revenue?")
+    assert not is_summary_request("Summarize section 3")
+    assert not is_summary_request("What were the key points about pricing raised by the board in the meeting last week?")
+    assert not is_summary_request("What is the total revenue?")
+    assert not is_summary_request("")
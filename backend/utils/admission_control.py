@@ -0,0 +1,217 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Mapping, Optional
+
+# Upper bound on per-client rate limit state kept in memory
+MAX_TRACKED_CLIENTS = 1024
+
+def worker_thread_count() -> int:
+    """Number of threads the Python worker uses to run sync functions.
+
+    Mirrors the worker's default when PYTHON_THREADPOOL_THREAD_COUNT is not set.
+    """
+    configured = os.getenv("PYTHON_THREADPOOL_THREAD_COUNT")
+    if configured:
+        return int(configured)
+    return min(32, (os.cpu_count() or 1) + 4)
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a retry hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate per minute."""
+
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = max(now, self.updated_at)
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available (0 if available now)."""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost: float) -> None:
+        self.tokens -= min(cost, self.capacity)
+
+class AdmissionController:
+    """Limit concurrent work globally and per client.
+
+    Requests that exceed a token rate, or that would give a client more than
+    `max_concurrent_per_client` running and queued requests, are rejected
+    immediately. Requests that only lack a free global slot wait in a bounded
+    queue until a slot frees up or their deadline passes, so admitted requests
+    keep predictable latency and overload turns into fast rejections instead
+    of timeouts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_concurrent_per_client: int,
+        max_queue: int,
+        queue_timeout: float,
+        tokens_per_minute: Optional[float] = None,
+        tokens_per_minute_per_client: Optional[float] = None
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_per_client = max_concurrent_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tokens_per_minute_per_client = tokens_per_minute_per_client
+
+        self._condition = threading.Condition()
+        self._active = 0
+        self._active_by_client: Dict[str, int] = defaultdict(int)
+        self._waiting = 0
+        self._waiting_by_client: Dict[str, int] = defaultdict(int)
+        self._bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._client_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _client_bucket(self, client_id: str, now: float) -> Optional[TokenBucket]:
+        if not self.tokens_per_minute_per_client:
+            return None
+        bucket = self._client_buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(self.tokens_per_minute_per_client)
+            self._client_buckets[client_id] = bucket
+            # Forget the least recently seen client, whose bucket has had the
+            # longest time to refill anyway
+            if len(self._client_buckets) > MAX_TRACKED_CLIENTS:
+                self._client_buckets.popitem(last=False)
+        else:
+            self._client_buckets.move_to_end(client_id)
+        return bucket
+
+    def _check_rate(self, client_id: str, cost: float) -> List[TokenBucket]:
+        """Reject if either token bucket cannot cover `cost`; return the buckets to charge."""
+        if cost <= 0:
+            return []
+        now = time.monotonic()
+        buckets = [b for b in (self._bucket, self._client_bucket(client_id, now)) if b is not None]
+        wait = max((b.wait_time(cost, now) for b in buckets), default=0.0)
+        if wait > 0:
+            raise AdmissionRejected(f"{self.name} token rate limit exceeded", wait)
+        return buckets
+
+    def acquire(self, client_id: str, cost: float = 0) -> None:
+        """Admit a request or raise AdmissionRejected."""
+        with self._condition:
+            self._check_rate(client_id, cost)
+
+            # Running and queued requests both count towards a client's share, so
+            # one client can never take over the queue shared by everyone
+            client_load = self._active_by_client.get(client_id, 0) + self._waiting_by_client.get(client_id, 0)
+            if client_load >= self.max_concurrent_per_client:
+                raise AdmissionRejected(f"{self.name} has too many concurrent requests from this client", self.queue_timeout)
+
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    raise AdmissionRejected(f"{self.name} queue is full", self.queue_timeout)
+
+                deadline = time.monotonic() + self.queue_timeout
+                self._waiting += 1
+                self._waiting_by_client[client_id] += 1
+                try:
+                    while self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise AdmissionRejected(f"{self.name} timed out waiting for capacity", self.queue_timeout)
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    self._waiting_by_client[client_id] -= 1
+                    if self._waiting_by_client[client_id] <= 0:
+                        del self._waiting_by_client[client_id]
+
+            # Other requests may have been charged while this one waited
+            buckets = self._check_rate(client_id, cost)
+            for bucket in buckets:
+                bucket.consume(cost)
+            self._active += 1
+            self._active_by_client[client_id] += 1
+
+    def try_charge(self, client_id: str, cost: float) -> bool:
+        """Charge tokens for work done outside an admitted request.
+
+        Returns False, charging nothing, if the rate limits cannot cover `cost`.
+        """
+        with self._condition:
+            try:
+                buckets = self._check_rate(client_id, cost)
+            except AdmissionRejected:
+                return False
+            for bucket in buckets:
+                bucket.consume(cost)
+            return True
+
+    def release(self, client_id: str) -> None:
+        """Free the slot held by an admitted request."""
+        with self._condition:
+            self._active -= 1
+            self._active_by_client[client_id] -= 1
+            if self._active_by_client[client_id] <= 0:
+                del self._active_by_client[client_id]
+            self._condition.notify_all()
+
+    @property
+    def max_threads(self) -> int:
+        """Worker threads this controller can block: running plus queued requests."""
+        return self.max_concurrent + self.max_queue
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get current load for logging."""
+        with self._condition:
+            return {
+                "active": self._active,
+                "waiting": self._waiting,
+                "clients": len(self._active_by_client)
+            }
+
+def client_id_from_headers(headers: Mapping[str, str]) -> str:
+    """Identify the caller of a request for per-client limits.
+
+    Only values set by the platform are trusted: the authenticated principal
+    when App Service authentication is on (it strips client supplied copies),
+    otherwise the address the Azure front end saw. That is X-Azure-ClientIP or
+    the last X-Forwarded-For entry, since earlier entries come from the client.
+    """
+    if os.getenv("WEBSITE_AUTH_ENABLED", "").lower() == "true":
+        principal_id = headers.get("x-ms-client-principal-id")
+        if principal_id:
+            return principal_id
+
+    client_ip = headers.get("x-azure-clientip")
+    if not client_ip:
+        forwarded_for = headers.get("x-forwarded-for")
+        if forwarded_for:
+            client_ip = forwarded_for.split(",")[-1]
+    client_ip = (client_ip or "").strip()
+    if not client_ip:
+        return "anonymous"
+
+    # Strip the port: "[2001:db8::1]:443" or "203.0.113.7:5678"
+    if client_ip.startswith("["):
+        return client_ip[1:].split("]")[0]
+    if client_ip.count(":") == 1:
+        return client_ip.split(":")[0]
+    return client_ip
@@ -13,21 +13,105 @@ def convert_chat_history(chat_history: List[Dict[str, str]]) -> List[Dict[str, s
             result.append(AIMessage(content=message["content"]))
     return result
 
-def create_llm(callback_manager=None):
+def create_llm(callback_manager=None, temperature=0.7):
     """Create an instance of AzureChatOpenAI.
     
     Args:
         callback_manager: Optional callback manager for capturing thinking logs
+        temperature: Sampling temperature for the model
     """
     return AzureChatOpenAI(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        temperature=0.7,
+        temperature=temperature,
         callback_manager=callback_manager
     )
 
+def build_system_message(document_sections, current_date, use_web_search=False):
+    """Build the system message with stable content first and volatile content last.
+    
+    Provider-side prompt caching only reuses the longest identical prefix of a
+    request, so the large document context leads (identical across turns and
+    users of the same documents) and per-request text such as the web search
+    instructions and today's date is appended at the end.
+    
+    Args:
+        document_sections: List of (filename, formatted_context) tuples in a deterministic order
+        current_date: Today's date, formatted for display
+        use_web_search: Whether the BingSearch tool is available for this request
+    """
+    parts = ["You are a helpful AI assistant."]
+    
+    if document_sections:
+        parts.append("\nUse the following document contents to answer questions:\n")
+        for filename, content in document_sections:
+            parts.append(f"\n[Document: {filename}]\n{content}\n")
+        parts.append("\nWhen using information from these documents, please specify which document you are referencing.")
+    
+    # Everything below varies per request or per day, so it must stay last
+    if use_web_search:
+        parts.append(" You have the ability to search the web for current information. When asked about current events, news, or anything time-sensitive, you should use the BingSearch tool to find up-to-date information.")
+        parts.append("""
+            The search tool will automatically include today's date to ensure results are current.
+            If you don't know the answer to a question, you can use the BingSearch tool to look it up.
+            """)
+    
+    parts.append(f"\nIMPORTANT: The current date is {current_date}. You MUST use this date when referring to today's date. DO NOT use any other date as today's date.")
+    return "".join(parts)
+
+def extract_token_usage(response) -> Dict[str, int]:
+    """Extract prompt, completion and cached prompt token counts from an LLMResult.
+    
+    Cached tokens are the part of the prompt served from the provider's prompt
+    cache; they are reported by Azure OpenAI under prompt_tokens_details.
+    """
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    
+    llm_output = getattr(response, "llm_output", None) or {}
+    token_usage = llm_output.get("token_usage") or {}
+    if token_usage:
+        usage["prompt_tokens"] = token_usage.get("prompt_tokens") or 0
+        usage["completion_tokens"] = token_usage.get("completion_tokens") or 0
+        details = token_usage.get("prompt_tokens_details") or {}
+        usage["cached_tokens"] = details.get("cached_tokens") or 0
+        return usage
+    
+    # Fall back to the usage metadata attached to each generated message
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            usage["prompt_tokens"] += metadata.get("input_tokens") or 0
+            usage["completion_tokens"] += metadata.get("output_tokens") or 0
+            details = metadata.get("input_token_details") or {}
+            usage["cached_tokens"] += details.get("cache_read") or 0
+    return usage
+
+def format_document_summary(document_content):
+    """Format the precomputed summary and outline of a document as context for the LLM."""
+    summary = document_content.get("summary") if isinstance(document_content, dict) else None
+    if not summary:
+        return ""
+    
+    parts = [f"Document summary:\n\n{summary['summary']}\n"]
+    
+    if len(summary["sections"]) > 1:
+        parts.append("\nSection summaries:\n")
+        for section in summary["sections"]:
+            first_page, last_page = section["pages"]
+            pages = f"Page {first_page}" if first_page == last_page else f"Pages {first_page}-{last_page}"
+            parts.append(f"\n{pages}:\n{section['summary']}\n")
+    
+    if summary["outline"]:
+        parts.append("\nOutline:\n")
+        for heading in summary["outline"]:
+            indent = "  " * (heading["level"] - 1)
+            parts.append(f"{indent}- {heading['title']} (page {heading['page']})\n")
+    
+    return "".join(parts)
+
 def format_document_context(document_content):
     """Format document content as context for the LLM."""
     import logging
@@ -47,13 +131,13 @@ def format_document_context(document_content):
                 return f"Document content:\n\n{document_content['content']}"
             # If content is a list (from old PDF format), format it page by page
             elif isinstance(document_content["content"], list):
-                context = "Document content:\n\n"
+                parts = ["Document content:\n\n"]
                 for page in document_content["content"]:
                     if isinstance(page, dict) and "page_num" in page and "text" in page:
-                        context += f"Page {page['page_num']}:\n{page['text']}\n\n"
+                        parts.append(f"Page {page['page_num']}:\n{page['text']}\n\n")
                     else:
-                        context += f"{str(page)}\n\n"
-                return context
+                        parts.append(f"{str(page)}\n\n")
+                return "".join(parts)
         else:
             logging.error("Document content dict does not have 'content' key")
             return ""
@@ -2,39 +2,77 @@ import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from utils.state_store import CachedStore, InMemoryBackend
+
 class DocumentStore:
-    """Simple in-memory document store to keep track of uploaded documents."""
+    """Simple document store to keep track of uploaded documents."""
     
-    def __init__(self):
-        # In-memory storage for document metadata
-        self.documents: List[Dict[str, Any]] = []
+    def __init__(self, backend=None):
+        # Document metadata lives in the state backend so every instance can list it
+        self.documents = CachedStore(backend or InMemoryBackend(), "metadata")
     
     def add_document(self, doc_id: str, filename: str, num_chunks: int) -> None:
         """Add a document to the store."""
-        self.documents.append({
+        now = datetime.now().isoformat()
+        self.documents.set(doc_id, {
             "doc_id": doc_id,
             "filename": filename,
             "num_chunks": num_chunks,
-            "uploaded_at": datetime.now().isoformat()
+            "uploaded_at": now,
+            "last_accessed_at": now
         })
         logging.info(f"Added document {filename} with ID {doc_id}")
     
     def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a document by ID."""
-        for doc in self.documents:
-            if doc["doc_id"] == doc_id:
-                return doc
-        return None
+        return self.documents.get(doc_id)
     
     def get_all_documents(self) -> List[Dict[str, Any]]:
-        """Get all documents."""
-        return self.documents
+        """Get all documents, oldest first."""
+        documents = [doc for doc in map(self.documents.get, self.documents.keys()) if doc]
+        return sorted(documents, key=lambda doc: doc["uploaded_at"])
     
     def remove_document(self, doc_id: str) -> bool:
         """Remove a document by ID."""
-        for i, doc in enumerate(self.documents):
-            if doc["doc_id"] == doc_id:
-                self.documents.pop(i)
-                logging.info(f"Removed document with ID {doc_id}")
-                return True
+        if self.documents.delete(doc_id):
+            logging.info(f"Removed document with ID {doc_id}")
+            return True
         return False
+    
+    def touch_document(self, doc_id: str) -> None:
+        """Record that a document was used, for idle-based eviction."""
+        # Revalidate so a document deleted by another instance is not written back
+        doc = self.documents.get(doc_id, revalidate=True)
+        if doc:
+            doc["last_accessed_at"] = datetime.now().isoformat()
+            self.documents.set(doc_id, doc)
+    
+    def get_expired_document_ids(
+        self,
+        ttl_seconds: Optional[float] = None,
+        idle_seconds: Optional[float] = None,
+        max_documents: Optional[int] = None
+    ) -> List[str]:
+        """Get IDs of documents that should be evicted.
+        
+        Args:
+            ttl_seconds: Evict documents uploaded longer ago than this
+            idle_seconds: Evict documents not accessed for longer than this
+            max_documents: Evict least recently accessed documents beyond this count
+        """
+        now = datetime.now()
+        expired = []
+        remaining = []
+        for doc in self.get_all_documents():
+            age = (now - datetime.fromisoformat(doc["uploaded_at"])).total_seconds()
+            idle = (now - datetime.fromisoformat(doc["last_accessed_at"])).total_seconds()
+            if (ttl_seconds and age > ttl_seconds) or (idle_seconds and idle > idle_seconds):
+                expired.append(doc["doc_id"])
+            else:
+                remaining.append(doc)
+        
+        if max_documents and len(remaining) > max_documents:
+            remaining.sort(key=lambda doc: doc["last_accessed_at"])
+            expired.extend(doc["doc_id"] for doc in remaining[:len(remaining) - max_documents])
+        
+        return expired
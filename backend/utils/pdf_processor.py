@@ -1,20 +1,39 @@
 import logging
 import uuid
 import os
+import re
+import threading
+import zlib
 import mimetypes
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable, Tuple
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, DocumentContentFormat, AnalyzeResult
 from azure.keyvault.secrets import SecretClient
 from azure.identity import DefaultAzureCredential
 from azure.core.credentials import AzureKeyCredential
 
+from utils.state_store import CachedStore, InMemoryBackend
+from utils.summary_utils import PAGE_BREAK
+from utils.chat_utils import format_document_context
+
+# Characters of formatted document context kept in memory, most recently used first
+FORMATTED_CONTEXT_CACHE_CHARS = int(os.getenv("FORMATTED_CONTEXT_CACHE_CHARS", "1000000"))
+PAGE_RANGE_PATTERN = re.compile(r"\bpages?\s+(\d+)(?:\s*(?:-|to)\s*(\d+))?\b", re.IGNORECASE)
+
 class DocumentProcessor:
     """Process documents using Azure Document Intelligence."""
     
-    def __init__(self):
-        # In-memory storage for document content
-        self.documents: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, backend=None):
+        backend = backend or InMemoryBackend()
+        # Document records (filename, page count, summary) and the zlib compressed
+        # text of each page live in the state backend so every instance can read them
+        self.documents = CachedStore(backend, "content")
+        self.pages = CachedStore(backend, "page", raw=True)
+        self._formatted_contexts: "OrderedDict[str, str]" = OrderedDict()
+        self._formatted_chars = 0
+        self._formatted_lock = threading.Lock()
         self.doc_client = self.get_document_client()
     
     def get_document_client(self):
@@ -73,12 +92,24 @@ class DocumentProcessor:
             # Generate a unique ID for this document
             doc_id = str(uuid.uuid4())
             
-            # Store the document content in memory
-            self.documents[doc_id] = {
+            # Store the document content compressed page by page, so pages can be
+            # read without decompressing the whole document
+            content = result.content or ""
+            page_texts = content.split(PAGE_BREAK)
+            compressed_size = 0
+            for page_num, page_text in enumerate(page_texts, start=1):
+                compressed = zlib.compress(page_text.encode("utf-8"))
+                compressed_size += len(compressed)
+                self.pages.set(f"{doc_id}:{page_num}", compressed)
+            
+            self.documents.set(doc_id, {
                 "filename": filename,
-                "content": result.content,
-                "pages": len(result.pages) if hasattr(result, 'pages') else 1
-            }
+                "pages": len(result.pages) if hasattr(result, 'pages') else 1,
+                "num_page_texts": len(page_texts),
+                "content_length": len(content),
+                "stored_at": datetime.now().isoformat()
+            })
+            logging.info(f"Stored {filename}: {len(content)} characters compressed to {compressed_size} bytes")
             
             return {
                 "doc_id": doc_id,
@@ -90,6 +121,128 @@ class DocumentProcessor:
             logging.error(f"Error processing document {filename}: {str(e)}")
             raise
     
+    def get_document_info(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get the stored record of a document (filename, page count, summary) without its text."""
+        # Revalidate so a document deleted by another instance is not used
+        return self.documents.get(doc_id, revalidate=True)
+    
+    def get_document_pages(self, doc_id: str, page_nums: Optional[Iterable[int]] = None) -> List[Tuple[int, str]]:
+        """Decompress the requested pages (all pages by default).
+        
+        Returns (page_num, text) pairs. Page numbers outside the document are ignored.
+        """
+        document = self.documents.get(doc_id)
+        if not document:
+            return []
+        num_pages = document["num_page_texts"]
+        if page_nums is None:
+            page_nums = range(1, num_pages + 1)
+        
+        pages = []
+        for page_num in page_nums:
+            if not 1 <= page_num <= num_pages:
+                continue
+            compressed = self.pages.get(f"{doc_id}:{page_num}")
+            if compressed is not None:
+                pages.append((page_num, zlib.decompress(compressed).decode("utf-8")))
+        return pages
+    
     def get_document_content(self, doc_id: str) -> Optional[Dict[str, Any]]:
-        """Get the content of a document by ID."""
-        return self.documents.get(doc_id)
+        """Get the content of a document by ID, decompressing all of its pages."""
+        document = self.documents.get(doc_id)
+        if not document:
+            return None
+        return {**document, "content": PAGE_BREAK.join(text for _, text in self.get_document_pages(doc_id))}
+    
+    def get_formatted_context(self, doc_id: str, query: Optional[str] = None) -> str:
+        """Get a document formatted as context for the LLM.
+        
+        A query such as "page 3" or "pages 2-4" returns only those pages,
+        clamped to the document; a range outside it returns the whole document.
+        The full formatted context is cached per document.
+        """
+        document = self.documents.get(doc_id)
+        if not document:
+            self._forget_formatted_context(doc_id)
+            return ""
+        
+        match = PAGE_RANGE_PATTERN.search(query) if query else None
+        if match:
+            # The query comes from the model, so never look up pages the document doesn't have
+            first_page = max(1, int(match.group(1)))
+            last_page = min(document["num_page_texts"], int(match.group(2) or match.group(1)))
+            pages = self.get_document_pages(doc_id, range(first_page, last_page + 1)) if first_page <= last_page else []
+            if pages:
+                return format_document_context({
+                    "content": [{"page_num": page_num, "text": text} for page_num, text in pages]
+                })
+        
+        with self._formatted_lock:
+            formatted = self._formatted_contexts.get(doc_id)
+            if formatted is not None:
+                self._formatted_contexts.move_to_end(doc_id)
+                return formatted
+        
+        document = self.get_document_content(doc_id)
+        # The pages may already be gone if the document was just deleted elsewhere
+        if not document or not document["content"].strip():
+            return ""
+        formatted = format_document_context(document)
+        # Documents larger than the whole cache are formatted on every request
+        if len(formatted) <= FORMATTED_CONTEXT_CACHE_CHARS:
+            with self._formatted_lock:
+                if doc_id not in self._formatted_contexts:
+                    self._formatted_contexts[doc_id] = formatted
+                    self._formatted_chars += len(formatted)
+                while self._formatted_chars > FORMATTED_CONTEXT_CACHE_CHARS:
+                    _, evicted = self._formatted_contexts.popitem(last=False)
+                    self._formatted_chars -= len(evicted)
+        return formatted
+    
+    def _forget_formatted_context(self, doc_id: str) -> None:
+        with self._formatted_lock:
+            formatted = self._formatted_contexts.pop(doc_id, None)
+            if formatted is not None:
+                self._formatted_chars -= len(formatted)
+    
+    def set_document_summary(self, doc_id: str, summary: Dict[str, Any]) -> None:
+        """Store the precomputed summary and outline alongside a document's content."""
+        # Revalidate so a document deleted by another instance is not written back
+        document = self.documents.get(doc_id, revalidate=True)
+        if document:
+            document["summary"] = summary
+            self.documents.set(doc_id, document)
+    
+    def get_orphaned_document_ids(self, known_doc_ids: Iterable[str], grace_seconds: float) -> List[str]:
+        """Get IDs of stored documents that are not in `known_doc_ids`.
+        
+        Content is stored before its metadata, so only records older than
+        `grace_seconds` are reported, which skips uploads still in progress.
+        """
+        known_doc_ids = set(known_doc_ids)
+        now = datetime.now()
+        orphaned = []
+        for doc_id in self.documents.keys():
+            if doc_id in known_doc_ids:
+                continue
+            document = self.documents.get(doc_id)
+            if not document:
+                continue
+            # Records stored before stored_at was added are old enough
+            stored_at = document.get("stored_at")
+            if stored_at and (now - datetime.fromisoformat(stored_at)).total_seconds() < grace_seconds:
+                continue
+            orphaned.append(doc_id)
+        return orphaned
+    
+    def remove_document(self, doc_id: str) -> bool:
+        """Remove the content of a document by ID."""
+        document = self.documents.get(doc_id)
+        if document:
+            for page_num in range(1, document["num_page_texts"] + 1):
+                self.pages.delete(f"{doc_id}:{page_num}")
+        self._forget_formatted_context(doc_id)
+        if not self.documents.delete(doc_id):
+            return False
+        logging.info(f"Removed content for document with ID {doc_id}")
+        return True
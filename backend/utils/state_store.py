@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+class InMemoryBackend:
+    """Process-local backend. Values are kept as-is, so nothing is shared between instances."""
+
+    shared = False
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._data.get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = value
+
+    def delete(self, key: str) -> bool:
+        return self._data.pop(key, None) is not None
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._data[key] = int(self._data.get(key) or 0) + 1
+            return self._data[key]
+
+    def keys(self, prefix: str) -> List[str]:
+        return [key for key in list(self._data) if key.startswith(prefix)]
+
+class SQLiteBackend:
+    """Backend storing bytes in a SQLite database, shared by every process that opens the same file."""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount > 0
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front so other processes can't interleave
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+                value = int(row[0]) + 1 if row else 1
+                self._conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, str(value).encode()))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def keys(self, prefix: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)).fetchall()
+        return [row[0] for row in rows]
+
+class RedisBackend:
+    """Backend storing bytes in Redis (or any server speaking the Redis protocol)."""
+
+    shared = True
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The 'redis' package is required when STATE_BACKEND is 'redis'") from e
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self._client.set(key, value)
+
+    def delete(self, key: str) -> bool:
+        return self._client.delete(key) > 0
+
+    def incr(self, key: str) -> int:
+        return self._client.incr(key)
+
+    def keys(self, prefix: str) -> List[str]:
+        return [key.decode() for key in self._client.scan_iter(match=f"{prefix}*")]
+
+def create_state_backend():
+    """Create the state backend selected by the STATE_BACKEND setting (memory, sqlite or redis)."""
+    backend_type = os.getenv("STATE_BACKEND", "memory").lower()
+    if backend_type == "redis":
+        logging.info("Using Redis state backend")
+        return RedisBackend(os.environ["REDIS_URL"])
+    if backend_type == "sqlite":
+        path = os.getenv("STATE_SQLITE_PATH", "state.db")
+        logging.info(f"Using SQLite state backend at {path}")
+        return SQLiteBackend(path)
+    return InMemoryBackend()
+
+class CachedStore:
+    """Namespaced key-value store over a backend with a local read-through cache.
+
+    Every write bumps a per-key version in the backend. A locally cached value
+    is trusted for `local_ttl` seconds and then revalidated by comparing its
+    version with the backend's, so large values are only transferred again
+    after another instance changed or removed them.
+
+    Values are JSON encoded for shared backends unless `raw` is set, in which
+    case they must already be bytes.
+    """
+
+    def __init__(self, backend, namespace: str, local_ttl: float = 5.0, max_local_entries: int = 64, raw: bool = False):
+        self.backend = backend
+        self.namespace = namespace
+        self.raw = raw
+        self.local_ttl = local_ttl
+        self.max_local_entries = max_local_entries
+        # key -> (version, value, validated_at)
+        self._local: "OrderedDict[str, Tuple[int, Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _version_key(self, key: str) -> str:
+        return f"{self.namespace}-version:{key}"
+
+    def _encode(self, value: Any) -> Any:
+        return json.dumps(value).encode() if self.backend.shared and not self.raw else value
+
+    def _decode(self, value: Any) -> Any:
+        return json.loads(value) if self.backend.shared and not self.raw else value
+
+    def _cache(self, key: str, version: int, value: Any) -> None:
+        # Process-local backends already hold the value in memory
+        if not self.backend.shared:
+            return
+        with self._lock:
+            self._local[key] = (version, value, time.monotonic())
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key: str, revalidate: bool = False) -> Optional[Any]:
+        """Get a value, from the local cache when it is still current.
+
+        With `revalidate` the cached copy is checked against the backend even
+        within the local TTL, so values removed by another instance are never
+        returned. That costs one small read of the version key.
+        """
+        with self._lock:
+            entry = self._local.get(key)
+        if entry and not revalidate and time.monotonic() - entry[2] < self.local_ttl:
+            return entry[1]
+
+        version = self.backend.get(self._version_key(key))
+        if version is None:
+            self.invalidate(key)
+            return None
+        version = int(version)
+        if entry and entry[0] == version:
+            self._cache(key, version, entry[1])
+            return entry[1]
+
+        raw = self.backend.get(self._key(key))
+        if raw is None:
+            self.invalidate(key)
+            return None
+        value = self._decode(raw)
+        self._cache(key, version, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value and invalidate copies cached by other instances."""
+        self.backend.set(self._key(key), self._encode(value))
+        version = self.backend.incr(self._version_key(key))
+        self._cache(key, version, value)
+
+    def delete(self, key: str) -> bool:
+        """Remove a value everywhere."""
+        self.backend.delete(self._version_key(key))
+        removed = self.backend.delete(self._key(key))
+        self.invalidate(key)
+        return removed
+
+    def invalidate(self, key: str) -> None:
+        """Drop the local copy of a value."""
+        with self._lock:
+            self._local.pop(key, None)
+
+    def keys(self) -> List[str]:
+        """Get all keys in this namespace."""
+        prefix = self._key("")
+        return [key[len(prefix):] for key in self.backend.keys(prefix)]
@@ -0,0 +1,148 @@
+import logging
+import re
+from typing import List, Dict, Any
+
+# Document Intelligence marks page boundaries in its markdown output
+PAGE_BREAK = "<!-- PageBreak -->"
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+SUMMARY_INTENT_PATTERN = re.compile(
+    r"\b(summari[sz]e|summary|summaries|overview|outline|tl;?dr|gist|key points|main points|what (is|are) (this|these|the) (document|file|paper|report)s? about)\b",
+    re.IGNORECASE
+)
+# Questions about a specific part of a document need its full text
+SPECIFIC_REFERENCE_PATTERN = re.compile(
+    r"\b(pages?|sections?|chapters?|tables?|figures?|fig|paragraphs?|clauses?|appendix|appendices|lines?|rows?|columns?)\b|\d",
+    re.IGNORECASE
+)
+# Longer messages are usually specific questions that merely mention a summary
+MAX_SUMMARY_REQUEST_WORDS = 12
+
+# Upper bounds on the text sent to the LLM in a single summarization call
+MAX_CHUNK_CHARS = 12000
+MAX_REDUCE_CHARS = 12000
+MAX_CONCURRENCY = 4
+# Reduce rounds before the remaining summaries are combined in one call
+MAX_REDUCE_ROUNDS = 4
+
+MAP_PROMPT = "You summarize part of a document. Write a concise summary of the key facts, figures, names and conclusions in the text below. Do not add information that is not in the text."
+REDUCE_PROMPT = "You combine partial summaries of a document into one coherent summary. Keep the most important facts, figures and conclusions and remove repetition."
+
+def split_into_chunks(content: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Dict[str, Any]]:
+    """Split document markdown into chunks of whole pages where possible."""
+    pages = content.split(PAGE_BREAK)
+    chunks = []
+    current, first_page, last_page = [], 1, 1
+    current_len = 0
+
+    for page_num, page in enumerate(pages, start=1):
+        page = page.strip()
+        if not page:
+            continue
+        # Pages longer than a chunk are split on their own
+        if len(page) > max_chars:
+            if current:
+                chunks.append({"pages": (first_page, last_page), "text": "\n\n".join(current)})
+                current, current_len = [], 0
+            for start in range(0, len(page), max_chars):
+                chunks.append({"pages": (page_num, page_num), "text": page[start:start + max_chars]})
+            continue
+        if current and current_len + len(page) > max_chars:
+            chunks.append({"pages": (first_page, last_page), "text": "\n\n".join(current)})
+            current, current_len = [], 0
+        if not current:
+            first_page = page_num
+        current.append(page)
+        current_len += len(page)
+        last_page = page_num
+
+    if current:
+        chunks.append({"pages": (first_page, last_page), "text": "\n\n".join(current)})
+    return chunks
+
+def extract_outline(content: str) -> List[Dict[str, Any]]:
+    """Extract the section outline from markdown headings."""
+    outline = []
+    page_num = 1
+    for page in content.split(PAGE_BREAK):
+        for match in HEADING_PATTERN.finditer(page):
+            outline.append({
+                "level": len(match.group(1)),
+                "title": match.group(2),
+                "page": page_num
+            })
+        page_num += 1
+    return outline
+
+def _summarize_texts(llm, system_prompt: str, texts: List[str]) -> List[str]:
+    """Summarize several texts in parallel."""
+    prompts = [
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+        for text in texts
+    ]
+    responses = llm.batch(prompts, config={"max_concurrency": MAX_CONCURRENCY})
+    return [response.content for response in responses]
+
+def _reduce_summaries(llm, summaries: List[str]) -> str:
+    """Combine summaries, in groups if they do not fit in one call.
+
+    Inputs are cut to half of MAX_REDUCE_CHARS so every group holds at least
+    two summaries and each round shrinks the list, however long the model's
+    answers are. The last round combines whatever is left in a single call.
+    """
+    for round_num in range(1, MAX_REDUCE_ROUNDS + 1):
+        if len(summaries) <= 1:
+            break
+        if round_num == MAX_REDUCE_ROUNDS:
+            limit = MAX_REDUCE_CHARS // len(summaries)
+            groups = [[summary[:limit] for summary in summaries]]
+        else:
+            groups, current, current_len = [], [], 0
+            for summary in summaries:
+                summary = summary[:MAX_REDUCE_CHARS // 2]
+                if current and current_len + len(summary) > MAX_REDUCE_CHARS:
+                    groups.append(current)
+                    current, current_len = [], 0
+                current.append(summary)
+                current_len += len(summary)
+            groups.append(current)
+
+        # A trailing group of one has nothing to combine and moves on as it is
+        to_reduce = [group for group in groups if len(group) > 1]
+        reduced = iter(_summarize_texts(llm, REDUCE_PROMPT, ["\n\n".join(group) for group in to_reduce]))
+        summaries = [next(reduced) if len(group) > 1 else group[0] for group in groups]
+    return summaries[0] if summaries else ""
+
+def summarize_document(llm, content: str) -> Dict[str, Any]:
+    """Build a hierarchical summary and outline of a document.
+
+    Each chunk of pages is summarized (map) and the chunk summaries are
+    combined into a document summary (reduce).
+
+    Args:
+        llm: Chat model used for the summarization calls
+        content: Document markdown from Document Intelligence
+    """
+    chunks = split_into_chunks(content)
+    if not chunks:
+        return {"summary": "", "sections": [], "outline": []}
+
+    logging.info(f"Summarizing document in {len(chunks)} chunks")
+    chunk_summaries = _summarize_texts(llm, MAP_PROMPT, [chunk["text"] for chunk in chunks])
+
+    return {
+        "summary": _reduce_summaries(llm, chunk_summaries),
+        "sections": [
+            {"pages": list(chunk["pages"]), "summary": summary}
+            for chunk, summary in zip(chunks, chunk_summaries)
+        ],
+        "outline": extract_outline(content)
+    }
+
+def is_summary_request(message: str) -> bool:
+    """Check whether a chat message only asks for a summary or overview of whole documents."""
+    if not message or len(message.split()) > MAX_SUMMARY_REQUEST_WORDS:
+        return False
+    return bool(SUMMARY_INTENT_PATTERN.search(message)) and not SPECIFIC_REFERENCE_PATTERN.search(message)
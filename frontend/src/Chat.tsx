@@ -250,6 +250,13 @@ const Chat: React.FC<ChatProps> = ({ messages, setMessages, activeDocuments, set
       
       const data = await response.json();
       
+      // Documents that expired or were deleted on the server are no longer used
+      if (data.missing_doc_ids && data.missing_doc_ids.length > 0) {
+        setActiveDocuments(prev => prev.filter(docId => !data.missing_doc_ids.includes(docId)));
+        setDocuments(prev => prev.filter(doc => !data.missing_doc_ids.includes(doc.doc_id)));
+        setUploadStatus('Some documents are no longer available and were removed. Please upload them again if needed.');
+      }
+      
       // Add AI response to chat
       const aiMessage: Message = {
         id: Date.now().toString(),